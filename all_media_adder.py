@@ -1,7 +1,8 @@
 import json
-import re
+from bisect import insort
 from collections import defaultdict
-from collections.abc import Mapping, MutableSequence, Sequence
+from collections.abc import Iterator, Mapping, MutableSequence, Sequence
+from operator import itemgetter
 from os import PathLike
 from pathlib import Path
 from typing import TypedDict, cast
@@ -9,10 +10,32 @@ from typing import TypedDict, cast
 import inquirer
 from inquirer.questions import Question
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class UserCancel(Exception): pass
 
 
+def _article_swap(title: str) -> str:
+    """Move a leading article to the end: 'The Thing' -> 'Thing, The'."""
+    first = title[:2]
+    if first == 'A ':
+        return f'{title[2:]}, A'
+    if first == 'An' and title[:3] == 'An ':
+        return f'{title[3:]}, An'
+    if first == 'Th' and title[:4] == 'The ':
+        return f'{title[4:]}, The'
+    return title
+
+
+def _prefix(s: str) -> str:
+    """Everything before the first ``\\`` or ``(`` in a series name."""
+    return s.split('\\', 1)[0].split('(', 1)[0]
+
+
 class MediaEntry(TypedDict):
     title: str
     series: str
@@ -20,8 +43,53 @@ class MediaEntry(TypedDict):
     title_override: str | None
 
 
+class SortedCategory:
+    """A category's series groups, kept sorted by their display key.
+
+    Keeping the sorted structure in memory means each add is an
+    insertion into an already-sorted list rather than a full regroup
+    and re-sort at export time.
+    """
+
+    def __init__(self, entries: Sequence[MediaEntry]) -> None:
+        self._groups_by_series = defaultdict[str, list[MediaEntry]](list)
+        for entry in entries:
+            self._groups_by_series[entry['series']].append(entry)
+        self._sorted_groups: list[tuple[str, list[MediaEntry]]] = []
+        for group in self._groups_by_series.values():
+            sorts = [entry['series_sort'] for entry in group]
+            if any(a > b for a, b in zip(sorts, sorts[1:])):
+                group.sort(key=itemgetter('series_sort'))
+            self._sorted_groups.append((self._sort_key(group), group))
+        self._sorted_groups.sort(key=itemgetter(0))
+
+    @staticmethod
+    def _sort_key(group: Sequence[MediaEntry]) -> str:
+        title = _article_swap(group[0].get('series') or group[0]['title'])
+        return title.casefold()
+
+    def add(self, entry: MediaEntry) -> None:
+        group = self._groups_by_series.get(entry['series'])
+        if group is None:
+            group = [entry]
+            self._groups_by_series[entry['series']] = group
+            insort(self._sorted_groups, (self._sort_key(group), group),
+                   key=itemgetter(0))
+        else:
+            insort(group, entry, key=itemgetter('series_sort'))
+
+    def display_titles(self) -> Iterator[str]:
+        for _, group in self._sorted_groups:
+            for entry in group:
+                yield _article_swap(entry.get('title_override')
+                                    or entry['title'])
+
+
 def add_entry(
     json_data: Mapping[str, MutableSequence[MediaEntry]],
+    titles_by_cat: Mapping[str, set[str]],
+    prefixes_by_cat: Mapping[str, dict[str, str]],
+    series_index: Mapping[str, dict[str, list[MediaEntry]]],
     category: str = '',
     series: str = '',
     include_title_override: bool = False,
@@ -59,27 +127,22 @@ def add_entry(
     title_override = answers.get('title_override', '').strip() or None
     existing_category = json_data[category]
 
-    if any(
-        entry['title'] == title
-        for entry in existing_category
-    ):
+    if title in titles_by_cat[category]:
         print('Already exists.')
         return
 
     if not series:
         series = handle_series(title=title,
-                               category_entries=existing_category)
+                               franchise_prefixes=prefixes_by_cat[category])
 
     series_sort = 0
     if series:
-        existing_series = [entry for entry in existing_category
-                           if entry['series'] == series]
-        existing_series.sort(key=lambda d: d['series_sort'])
+        existing_series = series_index[category].get(series, [])
         if existing_series:
-            title_to_entry_map = {entry['title']: entry
-                                  for entry in existing_series}
-            series_titles = list(title_to_entry_map.keys())
-            options = ['At the start', 'At the end'] + series_titles
+            options = [('At the start', 0),
+                       ('At the end', len(existing_series))]
+            options += [(entry['title'], i + 1)
+                        for i, entry in enumerate(existing_series)]
             questions = [
                 inquirer.List(
                     name='placement',
@@ -90,22 +153,12 @@ def add_entry(
             series_answer = inquirer.prompt(questions)
             if series_answer is None:
                 raise UserCancel
-            placement = series_answer['placement']
-            if placement == 'At the start':
-                series_titles.insert(0, title)
-            elif placement == 'At the end':
-                series_titles.append(title)
-            else:
-                placement_index = series_titles.index(placement)
-                placement_index += 1
-                series_titles.insert(placement_index, title)
-
-            for i, entry_title in enumerate(series_titles):
-                entry = title_to_entry_map.get(entry_title)
-                if entry is None:
-                    series_sort = i
-                else:
-                    entry['series_sort'] = i
+            placement_index = series_answer['placement']
+
+            for entry in existing_series:
+                if entry['series_sort'] >= placement_index:
+                    entry['series_sort'] += 1
+            series_sort = placement_index
 
     new_entry = MediaEntry(
         title=title,
@@ -114,17 +167,18 @@ def add_entry(
         title_override=title_override,
     )
     json_data[category].append(new_entry)
+    titles_by_cat[category].add(title)
+    if series and series not in prefixes_by_cat[category]:
+        prefixes_by_cat[category][series] = _prefix(series)
+    series_index[category][series].insert(series_sort, new_entry)
     return category, new_entry
 
 
-def handle_series(title: str, category_entries: Sequence[MediaEntry]) -> str:
-    existing_franchises = {series_name for entry in category_entries
-                           if (series_name := entry['series']) is not None}
-    series_regex = re.compile(r'^([^\\(]+)')
+def handle_series(title: str, franchise_prefixes: Mapping[str, str]) -> str:
     possible_franchises = [
-        series_name for series_name in existing_franchises
-        if (reg_match := re.match(series_regex, series_name)) is not None
-        if reg_match.group(0) in title
+        series_name for series_name, prefix in franchise_prefixes.items()
+        if series_name in title
+        or (prefix and prefix in title)
     ]
     series = None
     if possible_franchises:
@@ -159,53 +213,54 @@ def handle_series(title: str, category_entries: Sequence[MediaEntry]) -> str:
 
 
 def create_markdown(
-    json_data: Mapping[str, Sequence[MediaEntry]],
+    categories: Mapping[str, SortedCategory],
     export_path: PathLike | str = 'all_media.md',
 ) -> None:
-
-    def title_to_sort_by(group: list[MediaEntry]) -> str:
-        group.sort(key=lambda d: d['series_sort'])
-        title = group[0].get('series') or group[0]['title']
-        if title.startswith(('The ', 'A ', 'An ')):
-            article, rest = title.split(' ', 1)
-            title = f'{rest}, {article}'
-        return title.casefold()
-
-    category_titles = defaultdict[str, list[str]](list)
-    for category, entries in json_data.items():
-        series_groups: dict[str, list[MediaEntry]] = {}
-        for entry in entries:
-            series_groups.setdefault(entry['series'], []).append(entry)
-        sorted_series = sorted(
-            series_groups.values(),
-            key=title_to_sort_by
-        )
-        for group in sorted_series:
-            for entry in group:
-                title_to_use = entry.get('title_override') or entry['title']
-                if title_to_use.startswith(('The ', 'A ', 'An ')):
-                    article, rest = title_to_use.split(' ', 1)
-                    title_to_use = f'{rest}, {article}'
-                category_titles[category].append(title_to_use)
-
-    with open(export_path, mode='w', encoding='utf8') as f:
-        f.write('# All Media\n\n')
-        for category, title_list in category_titles.items():
-            f.write(f'## {category}\n')
-            for title in title_list:
-                f.write(f'- {title}\n')
-            f.write('\n')
+    parts = ['# All Media\n\n']
+    for category, sorted_category in categories.items():
+        parts.append(f'## {category}\n')
+        for title in sorted_category.display_titles():
+            parts.append(f'- {title}\n')
+        parts.append('\n')
+    Path(export_path).write_text(''.join(parts), encoding='utf8')
 
 
 def main():
     raw_file = Path('all_media_raw.json')
-    with raw_file.open(mode='r', encoding='utf8') as f:
-        existing_json: dict[str, list[MediaEntry]] = json.load(f)
+    existing_json: dict[str, list[MediaEntry]]
+    if orjson is not None:
+        existing_json = orjson.loads(raw_file.read_bytes())
+    else:
+        with raw_file.open(mode='r', encoding='utf8') as f:
+            existing_json = json.load(f)
+    titles_by_cat = {cat: {entry['title'] for entry in entries}
+                     for cat, entries in existing_json.items()}
+    prefixes_by_cat = {cat: {series_name: _prefix(series_name)
+                             for entry in entries
+                             if (series_name := entry['series']) is not None}
+                       for cat, entries in existing_json.items()}
+    series_index: dict[str, dict[str, list[MediaEntry]]] = {
+        cat: defaultdict[str, list[MediaEntry]](list)
+        for cat in existing_json}
+    for cat, entries in existing_json.items():
+        for entry in entries:
+            series_index[cat][entry['series']].append(entry)
+        for series_entries in series_index[cat].values():
+            series_entries.sort(key=itemgetter('series_sort'))
+            # Placement math treats series_sort as a position, so the
+            # values must be consecutive from 0 within each series.
+            for i, entry in enumerate(series_entries):
+                entry['series_sort'] = i
+    sorted_categories = {cat: SortedCategory(entries)
+                         for cat, entries in existing_json.items()}
     try:
         category = ''
         series = ''
         while True:
             entry_res = add_entry(json_data=existing_json,
+                                  titles_by_cat=titles_by_cat,
+                                  prefixes_by_cat=prefixes_by_cat,
+                                  series_index=series_index,
                                   category=category,
                                   series=series)
             if entry_res is None:
@@ -215,6 +270,7 @@ def main():
                 else:
                     continue
             selected_category, added_entry = entry_res
+            sorted_categories[selected_category].add(added_entry)
             questions = [
                 inquirer.List(
                     name='selection',
@@ -246,9 +302,15 @@ def main():
         if res.casefold() == 'n':
             return
     export_path = r'C:\Users\tomas\My Drive\Personal\Documents\All Media.md'
-    create_markdown(existing_json, export_path=export_path)
-    with raw_file.open(mode='w', encoding='utf-8') as f:
-        json.dump(existing_json, f, indent=4)
+    create_markdown(sorted_categories, export_path=export_path)
+    if orjson is not None:
+        raw_file.write_bytes(
+            orjson.dumps(existing_json,
+                         option=orjson.OPT_INDENT_2
+                         | orjson.OPT_APPEND_NEWLINE))
+    else:
+        with raw_file.open(mode='w', encoding='utf-8') as f:
+            json.dump(existing_json, f, indent=4)
     print('Saved!')
 
 